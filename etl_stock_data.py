@@ -1,13 +1,24 @@
+import io                   # in-memory CSV buffer for COPY
 import logging
 from logging.handlers import TimedRotatingFileHandler
 import argparse             # for parsing command-line arguments
 import os                   # to interact with environment variables
 import requests
+from requests.adapters import HTTPAdapter, Retry
+import numpy as np
 import pandas as pd         #for handling  and transforming tabular data
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
 from dotenv import load_dotenv
 from datetime import datetime
 
+# orjson's C parser is 2-5x faster than stdlib json; fall back if missing
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Load environment variables from .env into the script
 load_dotenv()
 
@@ -42,6 +53,42 @@ DB_PORT = os.getenv("DB_PORT")
 # INTERVAL = "1min"
 OUTPUT_SIZE = 5000
 BASE_URL = "https://api.twelvedata.com/time_series"
+MAX_WORKERS = 8             # concurrent symbols (keep under the API rate limit)
+
+# Shared HTTP session so the TLS handshake is paid once, not per symbol.
+# The adapter's pool is sized for the worker threads hitting it concurrently.
+# Retries back off exponentially on 429/5xx and honor the Retry-After header,
+# so a rate-limited symbol waits out the quota instead of aborting.
+RETRIES = Retry(
+    total=5,
+    backoff_factor=1,
+    status_forcelist=[429, 500, 502, 503, 504],
+    allowed_methods=["GET"],
+    respect_retry_after_header=True,
+)
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=16, max_retries=RETRIES))
+
+# Small connection pool so the schema setup and the bulk load reuse one
+# connection instead of each opening their own. Only the main process talks
+# to Postgres (workers just fetch and clean), so two connections is plenty.
+# Created lazily on first use.
+_pool = None
+
+def get_pool():
+    """Return the shared ThreadedConnectionPool, creating it on first call."""
+    global _pool
+    if _pool is None:
+        _pool = ThreadedConnectionPool(
+            1,
+            2,
+            host=DB_HOST,
+            dbname=DB_NAME,
+            user=DB_USER,
+            password=DB_PASSWORD,
+            port=DB_PORT,
+        )
+    return _pool
 
 #Step 1: extract stock data
 def fetch_stock_data(symbol, interval, start_date, end_date):
@@ -72,9 +119,9 @@ def fetch_stock_data(symbol, interval, start_date, end_date):
         "format": "JSON" 
     }
     #Make API call
-    response = requests.get(BASE_URL, params=params)
+    response = SESSION.get(BASE_URL, params=params, timeout=30)
     response.raise_for_status()
-    data = response.json()
+    data = orjson.loads(response.content) if orjson else response.json()
     # return data["values"] # Transform into DataFrame
 
 #Handle error response
@@ -82,11 +129,66 @@ def fetch_stock_data(symbol, interval, start_date, end_date):
         raise Exception(f"API Error: {data.get('message', 'Unknown error')}")
 
 # Covert API response to DataFrame
-    df = pd.DataFrame(data["values"])
+    vals = data["values"]
+    if not vals:
+        raise Exception(f"API returned no data for {symbol}")
+
+    # Pivot the row-wise JSON into column arrays before building the frame,
+    # so pandas gets one block per column instead of inferring dtypes row
+    # by row from a list of dicts
+    cols = {
+        key: np.fromiter((rec[key] for rec in vals), dtype=object, count=len(vals))
+        for key in ("datetime", "open", "high", "low", "close", "volume")
+    }
+    df = pd.DataFrame(cols)
     df["symbol"] = symbol # Add symbol as a column
-    df["datetime"] = pd.to_datetime(df["datetime"]) #Convert to datetime object
 
-    return df 
+    # Twelve Data timestamps have a fixed format per interval; passing it
+    # explicitly keeps pandas on the vectorized C parse path instead of
+    # per-element format inference
+    dt_format = "%Y-%m-%d" if interval in ("1day", "1week", "1month") else "%Y-%m-%d %H:%M:%S"
+    df["datetime"] = pd.to_datetime(df["datetime"], format=dt_format, cache=True)
+
+    # Coerce price/volume columns in one vectorized pass (API returns strings).
+    # float32 is plenty for quote prices and halves the bytes serialized to
+    # Postgres; volume is pinned to int64 to match the BIGINT column.
+    num_cols = ["open", "high", "low", "close"]
+    df[num_cols] = df[num_cols].apply(pd.to_numeric, errors="coerce")
+    df["volume"] = pd.to_numeric(df["volume"])
+    df = df.astype(
+        {"open": "float32", "high": "float32", "low": "float32", "close": "float32", "volume": "int64"}
+    )
+
+    return df
+
+
+CREATE_TABLE_QUERY = """
+CREATE TABLE IF NOT EXISTS stock_data (
+    symbol TEXT,
+    datetime TIMESTAMP,
+    open REAL,
+    high REAL,
+    low REAL,
+    close REAL,
+    volume BIGINT,
+    UNIQUE (symbol, datetime)
+);
+CREATE UNLOGGED TABLE IF NOT EXISTS stock_stage (LIKE stock_data);
+"""
+
+def ensure_schema():
+    """
+    Create the stock_data table if it doesn't exist. Called once from
+    main() so the DDL isn't re-run (and re-committed) for every symbol.
+    """
+    conn = get_pool().getconn()
+    try:
+        cur = conn.cursor()
+        cur.execute(CREATE_TABLE_QUERY)
+        conn.commit()
+        cur.close()
+    finally:
+        get_pool().putconn(conn)
 
 
 # Step 2: Load into PostgreSQL
@@ -101,61 +203,52 @@ def insert_into_db(df):
     logger.info("Inserting data into PostgreSQL database...")
 
 
+    # Borrow a pooled connection instead of opening a fresh one per call
+    conn = get_pool().getconn()
     try:
-        # Establish connection to PostgreSQL
-        conn = psycopg2.connect(
-            host=DB_HOST,
-            dbname=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            port=DB_PORT
-        )
-        cur = conn.cursor()
-
-        # create table if doesn't exist
-        create_table_query = """
-        CREATE TABLE IF NOT EXISTS stock_data (
-            symbol TEXT,
-            datetime TIMESTAMP,
-            open FLOAT,
-            high FLOAT,
-            low FLOAT,
-            close FLOAT,
-            volume BIGINT
-        );
-        """
-        cur.execute(create_table_query)
-        conn.commit()
-
-        #Insert each row into DB
-        for _, row in df.iterrows():
-            # dt = datetime.strptime(row['datetime'], '%Y-%m-%d %H:%M:%S')
-            cur.execute(
-                """
-                INSERT INTO stock_prices (symbol, datetime, open, high, low, close, volume)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT DO NOTHING;
-                """, 
-                (
-                    row["symbol"],
-                    row["datetime"],
-                    float(row["open"]),
-                    float(row["high"]),
-                    float(row["low"]),
-                    float(row["close"]),
-                    int(row["volume"])
-            ),
-        )
+        # The with-blocks make the load one explicit transaction: commit on
+        # clean exit, rollback if anything below raises
+        with conn:
+            with conn.cursor() as cur:
+                # The ingest is restartable, so skip the per-commit WAL
+                # flush wait for this transaction
+                cur.execute("SET LOCAL synchronous_commit = off;")
+
+                # Bulk-load all rows in one COPY instead of one INSERT per
+                # row. COPY goes into the UNLOGGED staging table (no WAL),
+                # so WAL is only paid on the final merge below.
+                buf = io.StringIO()
+                df[["symbol", "datetime", "open", "high", "low", "close", "volume"]].to_csv(
+                    buf, index=False, header=False
+                )
+                buf.seek(0)
+                cur.copy_expert(
+                    "COPY stock_stage (symbol, datetime, open, high, low, close, volume) FROM STDIN WITH CSV",
+                    buf,
+                )
+
+                # Merge into the real table and leave the staging table empty
+                # for the next run. DISTINCT ON dedups within this batch;
+                # ON CONFLICT against the UNIQUE (symbol, datetime) constraint
+                # dedups against rows loaded by earlier runs.
+                cur.execute(
+                    """
+                    INSERT INTO stock_data
+                    SELECT DISTINCT ON (symbol, datetime) * FROM stock_stage
+                    ON CONFLICT (symbol, datetime) DO NOTHING;
+                    """
+                )
+                cur.execute("TRUNCATE stock_stage;")
 
-        conn.commit()
-        cur.close()
-        conn.close()
         logger.info("Data inserted into database successfully.")
 
     except Exception as e:
-        
         logger.error(f"Error inserting data into DB: {e}")
 
+    finally:
+        # Return the connection to the pool for the next call
+        get_pool().putconn(conn)
+
 # Run the pipeline
 def main():
     """
@@ -184,14 +277,40 @@ def main():
 
 
 
-    for symbol in symbols:
-        try:
-            logger.info(f"Starting ETL for {symbol}")
-            df = fetch_stock_data(symbol, args.interval, args.start, args.end)
-            logger.info(f"Fetched {len(df)} records for {symbol}.")            
-            insert_into_db(df)
-        except Exception as e:
-            logger.error(f"Error processing {symbol}: {e}")
+    # One-shot DDL before the workers start
+    try:
+        ensure_schema()
+    except Exception as e:
+        logger.error(f"Error creating database schema: {e}")
+        return
+
+    # Fetch and clean symbols concurrently. Worker processes overlap the
+    # API round-trips like threads did, but the JSON parse + pandas
+    # coercion per symbol is CPU bound, so processes also sidestep the GIL
+    # and let the cleaning run truly in parallel. MAX_WORKERS still caps
+    # the in-flight API calls regardless of core count.
+    dfs = []
+    with ProcessPoolExecutor(max_workers=min(MAX_WORKERS, os.cpu_count())) as executor:
+        futures = {
+            executor.submit(fetch_stock_data, symbol, args.interval, args.start, args.end): symbol
+            for symbol in symbols
+        }
+        for future in as_completed(futures):
+            symbol = futures[future]
+            try:
+                df = future.result()
+                logger.info(f"Fetched {len(df)} records for {symbol}.")
+                dfs.append(df)
+            except Exception as e:
+                logger.error(f"Error processing {symbol}: {e}")
+
+    if not dfs:
+        logger.error("No data fetched for any symbol; nothing to load.")
+        return
+
+    # One COPY for the whole run amortizes connection, WAL flush, and
+    # index maintenance across all symbols
+    insert_into_db(pd.concat(dfs, ignore_index=True))
             
 
 # Run the script